@@ -10,6 +10,8 @@ CMD=( python3 /viofosync.py
       --timeout    "$TIMEOUT"
 )
 
+[ -n "$CONCURRENCY" ] && CMD+=( --concurrency "$CONCURRENCY" )
+
 # Map booleans
 [ -n "$DRY_RUN"    ] && CMD+=( --dry-run )
 [ -n "$GPS_EXTRACT" ] && CMD+=( --gps-extract )
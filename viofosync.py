@@ -20,31 +20,50 @@
 __version__ = "1.1"
 
 import argparse
+import contextlib
 import datetime
 import errno
 from collections import namedtuple
-import glob
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import fnmatch
+import functools
 import http.client
+import json
 import logging
+import mmap
+import multiprocessing
 import re
 import os
+import random
 import time
-import urllib.request
+import urllib.parse
 import socket
 import xml.etree.ElementTree as ET
 import struct
 import shutil
 import tempfile
+import threading
 
-from urllib.error import URLError
+from urllib.error import HTTPError, URLError
 
 # Constants
 dry_run = False
 max_disk_used_percent = 90
 cutoff_date = None
 socket_timeout = 10.0
-MAX_DOWNLOAD_ATTEMPTS = 3
-RETRY_BACKOFF = 5  # seconds between retries, multiplied by attempt number
+concurrency = 4
+segments = 4
+SEGMENT_MIN_SIZE = 64 << 20  # smaller recordings aren't worth the extra requests of a segmented download
+COPY_BUFSIZE = 1 << 20  # bytes per read()/write() when streaming recordings to disk
+max_download_attempts = 3
+retry_backoff = 5.0  # seconds before the first retry, doubled for every further attempt
+MAX_RETRY_BACKOFF = 60.0
+
+# Errors that suggest the camera or the Wi-Fi link hiccupped, rather than the file being unavailable
+TRANSIENT_ERRNOS = {
+    errno.ECONNRESET, errno.ECONNABORTED, errno.ECONNREFUSED, errno.EPIPE,
+    errno.ETIMEDOUT, errno.EHOSTUNREACH, errno.ENETUNREACH,
+}
 
 # Logging setup
 logging.basicConfig(
@@ -63,81 +82,405 @@ group_name_globs = {
     "yearly": "[0-9][0-9][0-9][0-9]",
 }
 
-downloaded_filename_glob = "[0-9]{4}_[0-9]{2}[0-9]{2}_[0-9]{6}[FR].MP4"
-downloaded_filename_re = re.compile(
-    r"^(?P<year>\d{4})_(?P<month>\d{2})(?P<day>\d{2})"
-    r"_(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})"
-    r"_(?P<sequence>\d{6})(?P<camera>[FR])\.MP4$"
-)
-
-Recording = namedtuple("Recording", "filename filepath size timecode datetime attr")
+# Group name of the date a recording was made, by grouping; look the function up once rather than per recording.
+# A camera's recordings span only a handful of dates, so each is formatted once and then served from the cache.
+group_name_formatters = {
+    grouping: functools.lru_cache(maxsize=None)(formatter) for grouping, formatter in {
+        "none": lambda d: None,
+        "daily": lambda d: d.strftime("%Y-%m-%d"),
+        "weekly": lambda d: (d - datetime.timedelta(days=d.weekday())).strftime("%Y-%m-%d"),
+        "monthly": lambda d: d.strftime("%Y-%m"),
+        "yearly": lambda d: d.strftime("%Y"),
+    }.items()
+}
 
+# YYYY_MMDD_HHMMSS_<sequence><camera>.MP4; once a name matches, its fields are at fixed offsets
+downloaded_filename_re = re.compile(r"\d{4}_\d{4}_\d{6}_\d{6}[FR]\.MP4")
 
-def to_downloaded_recording(filename, grouping):
-    match = downloaded_filename_re.match(filename)
-    if not match:
-        return None
-    gd = match.groupdict()
-    dt = datetime.datetime(
-        int(gd["year"]), int(gd["month"]), int(gd["day"]),
-        int(gd["hour"]), int(gd["minute"]), int(gd["second"])
-    )
-    return Recording(filename, None, None, None, dt, None)
+Recording = namedtuple("Recording", "filename filepath size timecode datetime attr")
+# A GPS sample as written to the GPX: ISO timestamp, signed decimal degrees, m/s and degrees
+GpsPoint = namedtuple("GpsPoint", "dt lat lon speed bearing")
+
+# One GPS sample: hour, minute, second, year, month, day, fix status, latitude/longitude hemispheres, padding, then
+# latitude, longitude, speed and bearing
+GPS_RECORD = struct.Struct('<6I3cx4f')
+NEGATIVE_HEMISPHERES = frozenset({b'S', b'W'})
+KNOTS_TO_METRES_PER_SECOND = 0.514444
+# MP4 atom header: size and type
+ATOM_HEADER = struct.Struct('>I4s')
+# Entry in the moov/gps table: position and size of a GPS atom
+GPS_INDEX_ENTRY = struct.Struct('>II')
+# GPS atom header: size, 'free' and the 'GPS ' magic
+GPS_ATOM_HEADER = struct.Struct('>I4s4s')
+GPX_HEADER = ('<?xml version="1.0"?>\n<gpx version="1.0" creator="Viofo GPS Extractor">\n'
+              '<trk><name>{name}</name><trkseg>\n')
+GPX_FOOTER = '</trkseg></trk>\n</gpx>\n'
+
+RemoteInfo = namedtuple("RemoteInfo", "size accept_ranges etag last_modified")
+
+# Idle kept-alive connections to the camera by host, shared by all download threads
+idle_connections = {}
+idle_connections_lock = threading.Lock()
+# open_url() retries a request that couldn't be sent a few times, quickly, to ride out blips such as a reset
+# connection; longer outages are left to the callers
+REQUEST_RETRIES = 3
+REQUEST_RETRY_BACKOFF = 0.3
+
+# Per-destination record of what the camera said about each downloaded recording, so that monitor_loop() can ask
+# whether anything changed instead of comparing sizes
+STATE_FILENAME = ".viofosync_state.json"
+
+# Directories ensure_destination() has already checked during the current batch of downloads
+ensured_dirs = set()
 
 
 def parse_viofo_datetime(time_str):
     return datetime.datetime.strptime(time_str, "%Y/%m/%d %H:%M:%S")
 
 
-def get_dashcam_filenames(base_url):
+# Recording field and conversion for each child of a <File> element in the camera's file list
+listing_fields = {
+    "NAME": ("filename", str),
+    "FPATH": ("filepath", str),
+    "SIZE": ("size", int),
+    "TIMECODE": ("timecode", int),
+    "TIME": ("datetime", parse_viofo_datetime),
+    "ATTR": ("attr", int),
+}
+
+
+def acquire_connection(host):
+    with idle_connections_lock:
+        idle = idle_connections.get(host)
+        if idle:
+            return idle.pop()
+    return http.client.HTTPConnection(host)
+
+
+def release_connection(host, conn):
+    with idle_connections_lock:
+        idle = idle_connections.setdefault(host, [])
+        # one connection per download thread and range is all we can use at once
+        if conn.sock is not None and len(idle) < concurrency * segments:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+def close_connections():
+    with idle_connections_lock:
+        for idle in idle_connections.values():
+            for conn in idle:
+                conn.close()
+        idle_connections.clear()
+
+
+@contextlib.contextmanager
+def open_url(url, method="GET", headers=None, timeout=None):
+    """
+    Stand-in for urllib.request.urlopen() that sends the request over a kept-alive connection to the camera, saving the
+    TCP handshake per request. Transient failures to send the request are retried briefly. Like urlopen(), raises
+    URLError if the request can't be sent and HTTPError for any non-2xx response. The connection goes back to the pool
+    once the response has been read to the end.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    timeout = socket_timeout if timeout is None else timeout
+    conn = acquire_connection(parts.netloc)
+    retries = 0
+    while True:
+        reused = conn.sock is not None
+        try:
+            conn.timeout = timeout
+            if reused:
+                conn.sock.settimeout(timeout)
+            conn.request(method, path, headers=headers or {})
+            resp = conn.getresponse()
+            break
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            if reused and not isinstance(e, socket.timeout):
+                # the camera dropped the idle connection; try once more on a fresh one
+                continue
+            # a timeout has already cost us a long wait, so isn't worth repeating here
+            if retries < REQUEST_RETRIES and not isinstance(e, socket.timeout) and is_transient_error(e):
+                time.sleep(REQUEST_RETRY_BACKOFF * 2 ** retries)
+                retries += 1
+                continue
+            if isinstance(e, OSError):
+                raise URLError(e) from e
+            raise
+
+    try:
+        if not 200 <= resp.status < 300:
+            resp.read()
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        yield resp
+    finally:
+        if resp.length == 0:
+            # HEAD and 304 responses have no body, but http.client only finishes with them once read
+            resp.read()
+        if resp.isclosed():
+            release_connection(parts.netloc, conn)
+        else:
+            conn.close()
+
+
+def get_dashcam_filenames(base_url, known=None, previous=None):
+    """
+    Fetches the camera's list of recordings. If known is given, it holds the etag/last_modified of the list the caller
+    already has: the request is made conditional on them and None is returned when the camera answers 304 Not
+    Modified; otherwise they're updated in place from the response once the list has been read.
+    previous maps filepath to the Recording from an earlier list; entries whose size and timecode haven't changed are
+    reused from it rather than converted again, which skips the slow strptime() of their TIME.
+    """
     url = f"{base_url}/?custom=1&cmd=3015&par=1"
+    headers = get_conditional_headers(known)
+    recordings = []
     try:
-        with urllib.request.urlopen(url, timeout=socket_timeout) as resp:
-            if resp.getcode() != 200:
-                raise RuntimeError(f"Bad status {resp.getcode()}")
-            xml_data = resp.read().decode()
+        # parse the list as it arrives, visiting each <File>'s children once. Finished <File>s, and the <ALLFile>
+        # wrapped around each, are cut out of the tree as we go; clearing them alone would still leave one empty
+        # element per recording attached to the root.
+        with open_url(url, headers=headers) as resp:
+            etag = resp.getheader("ETag")
+            # a camera that doesn't date the list still dates the response, which does as well for If-Modified-Since
+            last_modified = resp.getheader("Last-Modified") or resp.getheader("Date")
+            open_elems = []
+            files_open = 0
+            for event, elem in ET.iterparse(resp, events=("start", "end")):
+                if event == "start":
+                    open_elems.append(elem)
+                    files_open += elem.tag == "File"
+                    continue
+                open_elems.pop()
+                if elem.tag == "File":
+                    files_open -= 1
+                    rec = previous.get(elem.findtext("FPATH")) if previous else None
+                    if (rec is None or str(rec.size) != elem.findtext("SIZE")
+                            or str(rec.timecode) != elem.findtext("TIMECODE")):
+                        fields = {}
+                        for child in elem:
+                            field = listing_fields.get(child.tag)
+                            if field:
+                                name, convert = field
+                                fields[name] = convert(child.text)
+                        rec = Recording(**fields)
+                    recordings.append(rec)
+                elif files_open:
+                    # a field of the <File> still being read
+                    continue
+                if open_elems:
+                    # done with this element and everything before it
+                    del open_elems[-1][:]
+    except HTTPError as e:
+        if headers and e.code == 304:
+            logger.debug("File list unchanged")
+            return None
+        logger.error(f"Failed to fetch file list: {e}")
+        raise
     except Exception as e:
         logger.error(f"Failed to fetch file list: {e}")
         raise
 
-    root = ET.fromstring(xml_data)
-    recordings = []
-    for fe in root.findall(".//File"):
-        name = fe.find("NAME").text
-        path = fe.find("FPATH").text
-        size = int(fe.find("SIZE").text)
-        timecode = int(fe.find("TIMECODE").text)
-        ts = parse_viofo_datetime(fe.find("TIME").text)
-        attr = int(fe.find("ATTR").text)
-        recordings.append(Recording(name, path, size, timecode, ts, attr))
+    if known is not None:
+        known["etag"], known["last_modified"] = etag, last_modified
+
     logger.info(f"Found {len(recordings)} recordings on dashcam")
     return recordings
 
 
+@functools.lru_cache(maxsize=None)
+def get_destination_dir(destination, group_name):
+    return os.path.join(destination, group_name) if group_name else destination
+
+
 def get_filepath(destination, group_name, filename):
-    return os.path.join(destination, group_name, filename) if group_name else os.path.join(destination, filename)
+    return os.path.join(get_destination_dir(destination, group_name), filename)
+
+
+def get_conditional_headers(known):
+    headers = {}
+    if known:
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+    return headers
 
 
-def get_remote_size(url, timeout):
-    req = urllib.request.Request(url, method="HEAD")
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        cl = resp.getheader("Content-Length")
-    return int(cl) if cl and cl.isdigit() else None
+def get_remote_info(url, timeout, known=None):
+    """
+    HEADs url. If known holds the etag/last_modified of the copy we already have, the request is made conditional and
+    None is returned when the camera answers 304 Not Modified.
+    """
+    headers = get_conditional_headers(known)
+    try:
+        with open_url(url, "HEAD", headers, timeout) as resp:
+            return get_response_info(resp)
+    except HTTPError as e:
+        if headers and e.code == 304:
+            return None
+        raise
+
+
+def get_response_info(resp):
+    cl = resp.getheader("Content-Length")
+    if resp.status == 206:
+        # that's only the length of the range; the whole file's is in "Content-Range: bytes <first>-<last>/<size>"
+        cl = resp.getheader("Content-Range", "").rpartition("/")[2]
+    return RemoteInfo(
+        int(cl) if cl and cl.isdigit() else None,
+        resp.status == 206 or resp.getheader("Accept-Ranges", "").lower() == "bytes",
+        resp.getheader("ETag"),
+        resp.getheader("Last-Modified"),
+    )
+
+
+def get_resume_offset(resp, offset):
+    """
+    Returns the offset the body of a (possibly ranged) GET response starts at: offset if the server honoured
+    "Range: bytes=<offset>-", or 0 if it sent the whole file instead.
+    """
+    if resp.status != 206:
+        return 0
+    content_range = resp.getheader("Content-Range", "")
+    if not content_range.startswith(f"bytes {offset}-"):
+        raise http.client.HTTPException(f"Unexpected Content-Range: {content_range!r}")
+    return offset
+
+
+def allocate_file(fd, size):
+    """
+    Reserves size bytes for fd up front. The filesystem can then lay the file out in one go rather than extending it
+    write by write, which also avoids fragmentation from out-of-order range writes, and a full disk fails the download
+    straight away with ENOSPC instead of part way through.
+    """
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except AttributeError:
+        # not available on this platform; a sparse file works just as well for pwrite()
+        os.ftruncate(fd, size)
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP):
+            raise
+        # nor on this filesystem
+        os.ftruncate(fd, size)
+
+
+def drop_from_page_cache(path):
+    """
+    Tells the kernel we won't read the file at path again, so that syncing gigabytes of video doesn't push everything
+    else out of the page cache. Only pages already written back can be dropped, hence the fdatasync() first.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError as e:
+        logger.debug(f"Could not drop {path} from the page cache: {e}")
+    finally:
+        os.close(fd)
+
+
+def download_stream(url, path, have, timeout, resp=None, allocate=True):
+    """
+    Downloads url into path over a single connection, asking the server to skip the first `have` bytes already on disk.
+    If resp is given, it is an already open response to that GET and its body is used instead. allocate reserves the
+    rest of the file up front; leave it off for a file that may be resumed by its size after a crash.
+    Returns the number of bytes fetched.
+    """
+    headers = {"Range": f"bytes={have}-"} if have else {}
+    request = contextlib.nullcontext(resp) if resp else open_url(url, headers=headers, timeout=timeout)
+    with request as resp, open(path, "r+b") as out:
+        offset = 0
+        try:
+            offset = get_resume_offset(resp, have)
+        finally:
+            # a 200 means the server ignored the range; this also starts over on a bad Content-Range
+            out.seek(offset)
+            out.truncate()
+        if allocate and resp.length:
+            allocate_file(out.fileno(), offset + resp.length)
+        try:
+            shutil.copyfileobj(resp, out, COPY_BUFSIZE)
+        finally:
+            # give back whatever part of the allocation wasn't written, so the size is what we actually have
+            out.truncate()
+        return out.tell() - offset
+
+
+def download_ranges(url, path, ranges, timeout):
+    """
+    Fetches each [next, last] byte range of url over its own connection, writing the bodies straight into place in the
+    pre-allocated file at path with pwrite(). Each range's next offset is advanced as data arrives, so that a failed
+    attempt can be resumed. Returns the number of bytes fetched, or None if the server answered a range request with
+    the whole file.
+    """
+    def fetch(byte_range):
+        first, last = byte_range
+        with open_url(url, headers={"Range": f"bytes={first}-{last}"}, timeout=timeout) as resp:
+            if resp.status != 206:
+                return None
+            if not resp.getheader("Content-Range", "").startswith(f"bytes {first}-"):
+                raise http.client.HTTPException(f"Unexpected Content-Range: {resp.getheader('Content-Range')!r}")
+            while byte_range[0] <= last:
+                chunk = resp.read(min(COPY_BUFSIZE, last + 1 - byte_range[0]))
+                if not chunk:
+                    raise http.client.IncompleteRead(b"", last + 1 - byte_range[0])
+                os.pwrite(fd, chunk, byte_range[0])
+                byte_range[0] += len(chunk)
+        return last + 1 - first
+
+    pending = [r for r in ranges if r[0] <= r[1]]
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=len(pending) or 1) as pool:
+            fetched = list(pool.map(fetch, pending))
+    finally:
+        os.close(fd)
+    return None if None in fetched else sum(fetched)
+
+
+def is_transient_error(e):
+    """
+    Returns True if a failed download attempt is worth retrying. HTTP 4xx responses mean the file is gone or the request
+    is wrong, which asking again won't fix.
+    """
+    if isinstance(e, HTTPError):
+        return e.code >= 500
+    if isinstance(e, URLError):
+        e = e.reason
+    if isinstance(e, (socket.timeout, http.client.HTTPException)):
+        return True
+    return isinstance(e, OSError) and e.errno in TRANSIENT_ERRNOS
+
+
+def get_retry_delay(attempt):
+    """
+    Exponential backoff with jitter, so retries spread out instead of hitting a struggling camera in lockstep.
+    """
+    delay = min(retry_backoff * (2 ** (attempt - 1)), MAX_RETRY_BACKOFF)
+    return delay * (0.5 + random.random())
 
 
 def ensure_destination(path):
+    if path in ensured_dirs:
+        return
     if not os.path.exists(path):
-        os.makedirs(path)
+        # parallel downloads may race to create the same group directory
+        os.makedirs(path, exist_ok=True)
     elif not os.path.isdir(path):
         raise RuntimeError(f"Not a directory: {path}")
     elif not os.access(path, os.W_OK):
         raise RuntimeError(f"Not writable: {path}")
+    ensured_dirs.add(path)
 
 def is_camera_online(list_url, timeout):
     try:
-        req = urllib.request.Request(list_url, method="HEAD")
-        urllib.request.urlopen(req, timeout=timeout)
-        return True
+        with open_url(list_url, "HEAD", timeout=timeout):
+            return True
     except URLError as e:
         err = e.reason
         if isinstance(err, OSError) and err.errno == errno.EHOSTUNREACH:
@@ -146,6 +489,8 @@ def is_camera_online(list_url, timeout):
             logger.warning(f"Cannot reach camera ({err})")
     except socket.timeout:
         logger.warning("Camera timed out")
+    except http.client.HTTPException as e:
+        logger.warning(f"Cannot reach camera ({e!r})")
     return False
 
 def human_size_and_speed(num_bytes: int, elapsed: float):
@@ -175,100 +520,288 @@ def human_size_and_speed(num_bytes: int, elapsed: float):
     return size_str, speed_str
 
 
-def download_file(base_url, recording, destination, group_name, socket_timeout, dry_run):
+def get_file_size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return None
+
+
+def log_skipped(filename, size):
+    # called for nearly every recording on a repeat sync, so leave the formatting to logging, and only if it's shown
+    if logger.isEnabledFor(logging.DEBUG):
+        size_str, _ = human_size_and_speed(size, 1)
+        logger.debug("Skipping complete file: %s (%s)", filename, size_str)
+
+
+def download_file(base_url, recording, destination, group_name, socket_timeout, dry_run, is_active_file=False,
+                  progress=None):
+    """
+    Downloads recording into destination unless a complete copy is already there. is_active_file marks a recording the
+    camera may still be writing, whose size in the listing can't be trusted to say whether our copy is complete.
+    progress, e.g. "3/10", is logged with the attempt if there is one.
+    """
     cleaned = recording.filepath.replace('A:', '').replace('\\', '/')
     url = f"{base_url}/{cleaned}"
-    dest_dir = os.path.join(destination, group_name) if group_name else destination
+    dest_dir = get_destination_dir(destination, group_name)
     ensure_destination(dest_dir)
     final_path = os.path.join(dest_dir, recording.filename)
 
-    # 1) HEAD to get expected size
-    try:
-        expected_size = get_remote_size(url, socket_timeout)
-    except Exception as e:
-        logger.warning(f"Could not HEAD {recording.filename}: {e}")
-        expected_size = None
-
-    # 2) Skip if already complete
-    if expected_size is not None and os.path.exists(final_path):
-        if os.path.getsize(final_path) == expected_size:
-            size_str, _ = human_size_and_speed(os.path.getsize(final_path), 1)
-            logger.debug(f"Skipping complete file: {recording.filename} ({size_str})")
-            return False, None
-
-    if dry_run:
-        logger.info(f"[DRY RUN] Would download {recording.filename}")
-        return True, None
-
-    # 3) Download into .part with retries
-    tmp_fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=recording.filename, suffix=".part")
-    os.close(tmp_fd)
-    for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
+    # 0) The listing already gives the camera-side size; if the local file matches it there's nothing to fetch
+    if recording.size is not None and not is_active_file and get_file_size(final_path) == recording.size:
+        log_skipped(recording.filename, recording.size)
+        return False, None
+
+    # Whatever earlier attempts, in this run or an earlier one, left in <name>.part is resumed. That relies on the .part
+    # never being allocated ahead of the data, so that its size is what was actually written even after a run is
+    # killed. Downloads that can't be resumed allocate the whole file up front and go into <name>.tmp instead, which is
+    # always started afresh.
+    part_path = final_path + ".part"
+    have = get_file_size(part_path) or 0
+    if recording.size is not None and have >= recording.size:
+        # more than the recording holds; a leftover from an earlier version of it
+        have = 0
+    # a big recording is split over several connections, which make requests of their own
+    split = (not have and segments > 1 and recording.size is not None and recording.size > SEGMENT_MIN_SIZE
+             and hasattr(os, "pwrite"))
+
+    with contextlib.ExitStack() as stack:
+        # 1) Its headers give the expected size and whether we can resume. The request is the GET whose body the
+        #    download goes on to use: for the rest of the .part if there is one, otherwise for the whole file, unless
+        #    the recording is to be split, when there is no body to use and a HEAD does.
+        if have:
+            method, headers = "GET", {"Range": f"bytes={have}-"}
+        else:
+            method, headers = ("HEAD" if split else "GET"), None
         try:
-            logger.info(f"Downloading {recording.filename} (attempt {attempt})")
-            start = time.perf_counter()
-            with urllib.request.urlopen(url, timeout=socket_timeout) as resp, open(tmp_path, "wb") as out:
-                shutil.copyfileobj(resp, out)
-            elapsed = time.perf_counter() - start
+            try:
+                resp = stack.enter_context(open_url(url, method, headers, socket_timeout))
+            except HTTPError as e:
+                if not (have and e.code == 416):
+                    raise
+                # the .part is already as big as the recording, which must have been replaced since
+                have = 0
+                resp = stack.enter_context(open_url(url, timeout=socket_timeout))
         except Exception as e:
-            logger.warning(f"Attempt {attempt} failed: {e}")
-            time.sleep(RETRY_BACKOFF * attempt)
+            if not is_transient_error(e):
+                logger.error(f"Giving up on {recording.filename}: {e}")
+                return False, None
+            logger.warning(f"Could not {method} {recording.filename}: {e}")
+            resp = None
+        expected_size, accept_ranges, _, _ = get_response_info(resp) if resp else RemoteInfo(None, False, None, None)
+        if method == "HEAD":
+            stack.close()
+            resp = None
+        elif have and resp and resp.status != 206:
+            # the camera ignored the range and sent the whole file; that's what we download then
+            have = 0
+            accept_ranges = False
+
+        # 2) Skip if already complete; leaving the body unread only costs us the connection
+        if expected_size is not None and get_file_size(final_path) == expected_size:
+            log_skipped(recording.filename, expected_size)
+            return False, None
+
+        # only log the counter when you actually attempt to download
+        counter = f"[{progress}] " if progress else ""
+        logger.info(f"{counter}Attempting download of {recording.filename}")
+
+        if dry_run:
+            logger.info(f"[DRY RUN] Would download {recording.filename}")
+            return True, None
+
+        # 3) Download with retries, over several connections if the camera supports ranges and the recording is big
+        #    enough, otherwise over one
+        if not (accept_ranges and expected_size and have < expected_size):
+            have = 0
+        ranges = None
+        if have:
+            tmp_path = part_path
+        elif split and accept_ranges and expected_size and expected_size > SEGMENT_MIN_SIZE:
+            tmp_path = final_path + ".tmp"
+            ranges = [[expected_size * k // segments, expected_size * (k + 1) // segments - 1] for k in range(segments)]
         else:
-            actual_size = os.path.getsize(tmp_path)
-            if expected_size is not None and actual_size != expected_size:
-                actual_str, _   = human_size_and_speed(actual_size, 1)
-                expected_str, _ = human_size_and_speed(expected_size, 1)
-                logger.error(
-                    f"Incomplete download of {recording.filename}: "
-                    f"{actual_str}/{expected_str}"
-                )
-                os.remove(tmp_path)
-                time.sleep(RETRY_BACKOFF * attempt)
+            tmp_path = part_path if accept_ranges and expected_size else final_path + ".tmp"
+        try:
+            with open(tmp_path, "ab" if have else "wb") as tmp:
+                if ranges:
+                    allocate_file(tmp.fileno(), expected_size)
+        except OSError as e:
+            # e.g. ENOSPC; no point making the attempts
+            logger.error(f"Giving up on {recording.filename}: {e}")
+            if tmp_path != part_path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+            return False, None
+        for attempt in range(1, max_download_attempts + 1):
+            if attempt > 1:
+                time.sleep(get_retry_delay(attempt - 1))
+            try:
+                start = time.perf_counter()
+                if ranges:
+                    logger.info(f"Downloading {recording.filename} over {len(ranges)} connections (attempt {attempt})")
+                    fetched = download_ranges(url, tmp_path, ranges, socket_timeout)
+                    if fetched is None:
+                        logger.info(f"Camera ignored the range request for {recording.filename}; using one connection")
+                        ranges = None
+                        os.truncate(tmp_path, 0)
+                if not ranges:
+                    have = os.path.getsize(tmp_path) if accept_ranges else 0
+                    if have:
+                        logger.info(f"Resuming {recording.filename} at byte {have} (attempt {attempt})")
+                    else:
+                        logger.info(f"Downloading {recording.filename} (attempt {attempt})")
+                    # the GET from step 1 serves the first attempt
+                    first_resp, resp = resp, None
+                    fetched = download_stream(url, tmp_path, have, socket_timeout, first_resp, tmp_path != part_path)
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                if not is_transient_error(e):
+                    logger.error(f"Giving up on {recording.filename}: {e}")
+                    # e.g. the recording is gone; nothing to resume
+                    accept_ranges = False
+                    break
+                logger.warning(f"Attempt {attempt} failed: {e}")
             else:
-                size_str, speed_str = human_size_and_speed(actual_size, elapsed)
-                os.replace(tmp_path, final_path)
-                logger.info(
-                    f"Downloaded {recording.filename}: "
-                    f"{size_str} in {elapsed:.1f}s ({speed_str})"
-                )
-                return True, None
-
-    # all attempts failed
-    if os.path.exists(tmp_path):
-        os.remove(tmp_path)
-    logger.error(f"Failed to download {recording.filename} after {MAX_DOWNLOAD_ATTEMPTS} attempts")
+                actual_size = os.path.getsize(tmp_path)
+                if expected_size is not None and actual_size != expected_size:
+                    actual_str, _   = human_size_and_speed(actual_size, 1)
+                    expected_str, _ = human_size_and_speed(expected_size, 1)
+                    logger.error(
+                        f"Incomplete download of {recording.filename}: "
+                        f"{actual_str}/{expected_str}"
+                    )
+                    if actual_size > expected_size:
+                        os.truncate(tmp_path, 0)
+                else:
+                    size_str, _ = human_size_and_speed(actual_size, 1)
+                    _, speed_str = human_size_and_speed(fetched, elapsed)
+                    drop_from_page_cache(tmp_path)
+                    os.replace(tmp_path, final_path)
+                    if tmp_path != part_path:
+                        # a .part that wasn't resumed is stale now
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(part_path)
+                    logger.info(
+                        f"Downloaded {recording.filename}: "
+                        f"{size_str} in {elapsed:.1f}s ({speed_str})"
+                    )
+                    return True, None
+
+    # all attempts failed; keep the .part for the next run to resume. A .tmp is pre-allocated and, with ranges, filled
+    # out of order, so its size says nothing about what was written.
+    if tmp_path != part_path or not accept_ranges:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+    logger.error(f"Failed to download {recording.filename} after {attempt} attempts")
     return False, None
 
 
+def load_state(destination):
+    path = os.path.join(destination, STATE_FILENAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable state file {path}: {e}")
+        return {}
+
+
+def save_state(destination, state):
+    if dry_run:
+        return
+    ensure_destination(destination)
+    path = os.path.join(destination, STATE_FILENAME)
+    try:
+        with tempfile.NamedTemporaryFile("w", dir=destination, prefix=STATE_FILENAME, delete=False) as f:
+            json.dump(state, f)
+        os.replace(f.name, path)
+    except OSError as e:
+        logger.warning(f"Could not save state file {path}: {e}")
+
+
+def get_state_entry(remote, st):
+    return {
+        "size": remote.size, "etag": remote.etag, "last_modified": remote.last_modified,
+        "mtime_local": st.st_mtime_ns,
+    }
+
+
+def is_state_current(entry, st):
+    """
+    Returns True if the local file, as described by the stat result st, is still the one the state entry was recorded
+    for.
+    """
+    return st is not None and st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_local"]
+
+
+def scan_local_files(destination, grouping):
+    """
+    Returns {path: stat result} for the files in destination and, when grouping, in its group directories. One
+    directory listing replaces the exists/getsize/stat calls per recording.
+    """
+    files = {}
+    try:
+        entries = list(os.scandir(destination))
+    except FileNotFoundError:
+        return files
+    for entry in entries:
+        if entry.is_file():
+            files[entry.path] = entry.stat()
+        elif grouping != "none" and entry.is_dir():
+            with os.scandir(entry.path) as group_entries:
+                files.update((e.path, e.stat()) for e in group_entries if e.is_file())
+    return files
+
+
 def get_downloaded_recordings(destination, grouping):
-    glob_pattern = get_filepath(destination, group_name_globs[grouping], downloaded_filename_glob)
-    files = glob.glob(glob_pattern)
-    recs = set()
-    for fp in files:
-        fn = os.path.basename(fp)
-        m = downloaded_filename_re.match(fn)
-        if m:
-            dt = datetime.date(int(m.group("year")), int(m.group("month")), int(m.group("day")))
-            recs.add((fn, dt))
-    return recs
+    """
+    Returns ({filename: date} for the recordings in destination, {stem: [paths]} for every file there), from one pass
+    over destination or, when grouping, its group directories. A recording's stem also covers its .gpx and the like.
+    """
+    recs = {}
+    files_by_stem = {}
+    try:
+        entries = list(os.scandir(destination))
+    except FileNotFoundError:
+        return recs, files_by_stem
+    if grouping != "none":
+        # recordings only live one level down, in the group directories
+        group_glob = group_name_globs[grouping]
+        group_dirs = [e.path for e in entries if e.is_dir() and fnmatch.fnmatchcase(e.name, group_glob)]
+        entries = []
+        for group_dir in group_dirs:
+            with os.scandir(group_dir) as group_entries:
+                entries.extend(group_entries)
+    for entry in entries:
+        if not entry.is_file():
+            continue
+        fn = entry.name
+        files_by_stem.setdefault(fn.partition(".")[0], []).append(entry.path)
+        if downloaded_filename_re.fullmatch(fn):
+            recs[fn] = datetime.date(int(fn[0:4]), int(fn[5:7]), int(fn[7:9]))
+    return recs, files_by_stem
 
 
 def get_outdated_recordings(destination, grouping):
+    """
+    Returns [(filename, [paths])] for the recordings older than the cutoff date.
+    """
     if cutoff_date is None:
         return []
-    downloaded = get_downloaded_recordings(destination, grouping)
-    return [fn for fn, dt in downloaded if dt < cutoff_date]
+    downloaded, files_by_stem = get_downloaded_recordings(destination, grouping)
+    return [(fn, files_by_stem[fn.partition(".")[0]]) for fn, dt in downloaded.items() if dt < cutoff_date]
 
 
 def prepare_destination(destination, grouping):
     if cutoff_date:
-        for fn in get_outdated_recordings(destination, grouping):
+        for fn, paths in get_outdated_recordings(destination, grouping):
             if dry_run:
                 logger.info(f"[DRY RUN] Would remove {fn}")
                 continue
-            gp = group_name_globs[grouping]
-            pattern = f"{os.path.splitext(fn)[0]}.*"
-            for p in glob.glob(get_filepath(destination, gp, pattern)):
+            for p in paths:
                 try:
                     os.remove(p)
                     logger.info(f"Removed old file {p}")
@@ -276,6 +809,79 @@ def prepare_destination(destination, grouping):
                     logger.error(f"Error removing {p}: {e}")
 
 
+def report_gps_failure(fp, future):
+    # nothing waits on an extraction's result, so this is the only place an error escaping it (or its worker dying)
+    # can surface
+    if not future.cancelled() and future.exception():
+        logger.error(f"GPS extraction failed for {fp}: {future.exception()!r}")
+
+
+def download_recordings(base_url, recs, destination, grouping, args, list_url=None):
+    """
+    Downloads recordings in parallel, at most `concurrency` at a time.
+    If list_url is given, the camera is checked before each download and the remaining downloads are abandoned once it
+    goes offline. Returns False if the batch was abandoned.
+    """
+    total = len(recs)
+    group_name_of = group_name_formatters[grouping]
+    # the newest recordings (front and rear share a start time) may still be growing on the camera
+    latest = max((rec.datetime for rec in recs), default=None)
+    offline = threading.Event()
+    aborted = threading.Event()
+    # a handful of group directories serve the whole batch, so check each once up front; they're checked afresh every
+    # batch in case one was removed in between
+    ensured_dirs.clear()
+    for grp in {group_name_of(rec.datetime.date()) for rec in recs}:
+        ensure_destination(get_destination_dir(destination, grp))
+
+    # GPS extraction is CPU-bound pure Python, so it gets processes of its own and overlaps with the downloads.
+    # Workers are spawned rather than forked, as forking while the download threads run can deadlock.
+    gps_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_gps_worker, initargs=(logger.level,)
+    ) if args.gps_extract and not args.dry_run else None
+
+    def download(i, rec):
+        if offline.is_set() or aborted.is_set():
+            return
+        # check *again* before each file
+        if list_url and not is_camera_online(list_url, socket_timeout):
+            offline.set()
+            return
+
+        grp = group_name_of(rec.datetime.date())
+        downloaded, _ = download_file(
+            base_url, rec, destination, grp,
+            args.timeout, args.dry_run, rec.datetime == latest, f"{i}/{total}"
+        )
+        # only the front camera records GPS, so rear (...R.MP4) recordings aren't even handed to a worker
+        if downloaded and gps_pool and not rec.filename.endswith("R.MP4"):
+            fp = get_filepath(destination, grp, rec.filename)
+            gps_pool.submit(extract_gps_data, fp).add_done_callback(functools.partial(report_gps_failure, fp))
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(download, i, rec) for i, rec in enumerate(recs, start=1)]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # e.g. Ctrl+C; only wait for the downloads already running, not for everything still queued
+                aborted.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    except BaseException:
+        if gps_pool:
+            gps_pool.shutdown(cancel_futures=True)
+        raise
+    else:
+        if gps_pool:
+            # wait for the extractions still running
+            gps_pool.shutdown()
+
+    return not offline.is_set()
+
+
 def sync(address, destination, grouping, download_priority, recording_filter, args):
     logger.info(f"Starting sync for {address}")
     prepare_destination(destination, grouping)
@@ -293,192 +899,149 @@ def sync(address, destination, grouping, download_priority, recording_filter, ar
         recs = [r for r in recs if any(f in r.filename for f in recording_filter)]
         logger.info(f"After filter: {len(recs)} recordings")
 
-    total = len(recs)
-    for i, rec in enumerate(recs, start=1):
-        if cutoff_date and rec.datetime.date() < cutoff_date:
-            continue
-
-        # build group & local path
-        grp = get_group_name(rec.datetime, grouping)
-        local_dir = os.path.join(destination, grp) if grp else destination
-        local_path = os.path.join(local_dir, rec.filename)
-
-        # HEAD to fetch remote size
-        cleaned = rec.filepath.replace('A:', '').replace('\\', '/')
-        url = f"{base_url}/{cleaned}"
-        try:
-            remote_size = get_remote_size(url, args.timeout)
-        except Exception as e:
-            logger.warning(f"Could not HEAD {rec.filename}: {e} — will download")
-            remote_size = None
-
-        # if we know remote size and it matches local, skip
-        if remote_size is not None and os.path.exists(local_path):
-            local_size = os.path.getsize(local_path)
-            if local_size == remote_size:
-                size_str, _ = human_size_and_speed(local_size, 1)
-                logger.debug(f"Skipping unchanged file: {rec.filename} ({size_str})")
-                continue
-
-        # only log the counter when you actually attempt to download
-        logger.info(f"[{i}/{total}] Attempting download of {rec.filename}")
-        downloaded, _ = download_file(
-            base_url, rec, destination, grp,
-            args.timeout, args.dry_run
-        )
-        if downloaded and args.gps_extract:
-            extract_gps_data(local_path)
+    # download_file() skips recordings we already have, based on the headers of its GET
+    to_dl = [r for r in recs if not (cutoff_date and r.datetime.date() < cutoff_date)]
+    download_recordings(base_url, to_dl, destination, grouping, args)
 
     logger.info("Sync complete")
     return True
 
 
-def get_group_name(dt, grouping):
-    if grouping == "daily":
-        return dt.strftime("%Y-%m-%d")
-    if grouping == "weekly":
-        start = dt - datetime.timedelta(days=dt.weekday())
-        return start.strftime("%Y-%m-%d")
-    if grouping == "monthly":
-        return dt.strftime("%Y-%m")
-    if grouping == "yearly":
-        return dt.strftime("%Y")
-    return None
-
-
-# GPS extraction helpers (unchanged)...
-def fix_time(hour, minute, second, year, month, day):
-    return f"{year+2000:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}Z"
-
-
-def fix_coordinates(hemi, coord):
-    mins = coord % 100.0
-    deg = coord - mins
-    val = deg / 100.0 + mins / 60.0
-    return -val if hemi in ['S', 'W'] else val
-
-
-def fix_speed(s): return s * 0.514444
-
-
-def get_atom_info(b):
-    # if we didn’t get 8 bytes, signal “no more atoms”
-    if len(b) < 8:
-        return 0, ''
-    size, raw_type = struct.unpack('>I4s', b)
-    try:
-        atom_type = raw_type.decode('utf-8')
-    except UnicodeDecodeError:
-        atom_type = ''
-    return size, atom_type
-
-def get_gps_atom_info(b):
-    pos, size = struct.unpack('>II', b)
-    return pos, size
-
-
-def get_gps_data(data):
-    gps = {'DT': {}, 'Loc': {}}
-    off = 0
-    hour, minute, second, year, month, day = struct.unpack_from('<IIIIII', data, off)
-    off += 24
-    act, lat_h, lon_h = struct.unpack_from('<ccc', data, off)
-    off += 4
-    lat_r, lon_r, sp, bc = struct.unpack_from('<ffff', data, off)
-    gps['DT'] = {
-        'Hour': hour, 'Minute': minute, 'Second': second,
-        'Year': year, 'Month': month, 'Day': day,
-        'DT': fix_time(hour, minute, second, year, month, day)
-    }
-    gps['Loc'] = {
-        'Lat': {
-            'Raw': lat_r, 'Hemi': lat_h.decode(),
-            'Float': fix_coordinates(lat_h.decode(), lat_r)
-        },
-        'Lon': {
-            'Raw': lon_r, 'Hemi': lon_h.decode(),
-            'Float': fix_coordinates(lon_h.decode(), lon_r)
-        },
-        'Speed': fix_speed(sp),
-        'Bearing': bc
-    }
-    return gps
-
-
-def get_gps_atom(gps_info, fh):
-    pos, size = gps_info
-    fh.seek(pos)
-    data = fh.read(size)
-    s1, t, m = struct.unpack_from('>I4s4s', data)
-    if t.decode() != 'free' or m.decode() != 'GPS ' or s1 != size:
-        return None
-    return get_gps_data(data[12:])
-
+# GPS extraction
+def get_atom_info(buf, offset):
+    # if there aren't 8 bytes left, signal “no more atoms”
+    if offset + ATOM_HEADER.size > len(buf):
+        return 0, b''
+    return ATOM_HEADER.unpack_from(buf, offset)
 
-def parse_moov(fh):
-    gps_data = []
+def decode_gps_samples(buf, gps_infos):
+    """
+    Returns the GPS samples with a satellite fix among the (position, size) entries of gps_infos, converted for the
+    GPX: ISO time, signed decimal degrees from NMEA-style (d)ddmm.mmmm and metres per second from knots. This runs once
+    per sample, so it is one loop with the lookups hoisted and the conversions inline, rather than a call per field.
+    """
+    points = []
+    append = points.append
+    # _make() builds the tuple directly, skipping the Python-level __new__() of GpsPoint(...)
+    make_point = GpsPoint._make
+    unpack_header = GPS_ATOM_HEADER.unpack_from
+    unpack_record = GPS_RECORD.unpack_from
+    header_size = GPS_ATOM_HEADER.size
+    min_size = header_size + GPS_RECORD.size
+    buf_size = len(buf)
+    for pos, size in gps_infos:
+        if pos == 0 or size < min_size or pos + size > buf_size:
+            # unused slot in the table
+            continue
+        s1, t, m = unpack_header(buf, pos)
+        if t != b'free' or m != b'GPS ' or s1 != size:
+            continue
+        hour, minute, second, year, month, day, act, lat_h, lon_h, lat, lon, speed, bearing = \
+            unpack_record(buf, pos + header_size)
+        if act != b'A':
+            # no satellite fix for this sample
+            continue
+        mins = lat % 100.0
+        lat = (lat - mins) / 100.0 + mins / 60.0
+        mins = lon % 100.0
+        lon = (lon - mins) / 100.0 + mins / 60.0
+        append(make_point((
+            f"{year+2000:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}Z",
+            -lat if lat_h in NEGATIVE_HEMISPHERES else lat,
+            -lon if lon_h in NEGATIVE_HEMISPHERES else lon,
+            speed * KNOTS_TO_METRES_PER_SECOND,
+            bearing,
+        )))
+    return points
+
+
+def parse_moov(buf):
+    """
+    Walks the atoms of an MP4 held in buf (typically an mmap of the file) and returns its GPS samples.
+    """
+    gps_infos = []
     offset = 0
 
     while True:
-        header = fh.read(8)
-        if len(header) < 8:
-            break
-
-        atom_size, atom_type = get_atom_info(header)
-        if atom_size == 0:
+        atom_size, atom_type = get_atom_info(buf, offset)
+        if atom_size < 8:
             break
 
-        if atom_type == 'moov':
+        if atom_type == b'moov':
             sub_offset = offset + 8
             # keep reading sub-atoms until we hit the end of this moov atom
             while sub_offset + 8 <= offset + atom_size:
-                sub_header = fh.read(8)
-                if len(sub_header) < 8:
+                sub_size, sub_type = get_atom_info(buf, sub_offset)
+                if sub_size < 8:
                     break
 
-                sub_size, sub_type = get_atom_info(sub_header)
-
-                if sub_type == 'gps ':
-                    # … your existing GPS-extraction logic here …
-                    pass
+                if sub_type == b'gps ':
+                    # after its header and 8 bytes of version/date, the atom is a table pointing at the GPS samples
+                    table_start = sub_offset + 16
+                    table_end = min(sub_offset + sub_size, len(buf))
+                    # decode the whole table in one call rather than entry by entry
+                    count = max(table_end - table_start, 0) // GPS_INDEX_ENTRY.size
+                    gps_infos.extend(GPS_INDEX_ENTRY.iter_unpack(
+                        buf[table_start:table_start + count * GPS_INDEX_ENTRY.size]
+                    ))
 
                 sub_offset += sub_size
-                fh.seek(sub_offset, 0)
 
         offset += atom_size
-        fh.seek(offset, 0)
 
-    return gps_data
+    return decode_gps_samples(buf, gps_infos)
+
 
-def generate_gpx(gps_data, out_file):
-    gpx = '<?xml version="1.0"?>\n<gpx version="1.0" creator="Viofo GPS Extractor">\n<trk><name>' \
-          + out_file + '</name><trkseg>\n'
+def write_gpx(gps_data, fh, name):
+    """
+    Writes gps_data to fh as a GPX track called name, one trackpoint at a time rather than building the document in
+    memory.
+    """
+    write = fh.write
+    write(GPX_HEADER.format(name=name))
     for g in gps_data:
-        gpx += (
-            f'\t<trkpt lat="{g["Loc"]["Lat"]["Float"]}" '
-            f'lon="{g["Loc"]["Lon"]["Float"]}">'
-            f'<time>{g["DT"]["DT"]}</time>'
-            f'<speed>{g["Loc"]["Speed"]}</speed>'
-            f'<course>{g["Loc"]["Bearing"]}</course>'
+        write(
+            f'\t<trkpt lat="{g.lat}" lon="{g.lon}">'
+            f'<time>{g.dt}</time>'
+            f'<speed>{g.speed}</speed>'
+            f'<course>{g.bearing}</course>'
             '</trkpt>\n'
         )
-    gpx += '</trkseg></trk>\n</gpx>\n'
-    return gpx
+    write(GPX_FOOTER)
+
+
+def init_gps_worker(log_level):
+    logger.setLevel(log_level)
 
 
 def extract_gps_data(fp):
     logger.info(f"Extracting GPS from {fp}")
-    with open(fp, "rb") as f:
-        data = parse_moov(f)
+    try:
+        with open(fp, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                # only the atom headers and the scattered GPS samples are read, so readahead around each page fault
+                # would mostly pull in video
+                mm.madvise(mmap.MADV_RANDOM)
+            data = parse_moov(mm)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Could not read GPS data from {fp}: {e}")
+        return
     if not data:
         logger.warning("No GPS data found")
         return
-    gpx = generate_gpx(data, os.path.basename(fp) + ".gpx")
-    with open(fp + ".gpx", "w") as out:
-        out.write(gpx)
+    with open(fp + ".gpx", "w", buffering=COPY_BUFSIZE) as out:
+        write_gpx(data, out, os.path.basename(fp) + ".gpx")
         logger.info(f"Wrote GPX to {fp}.gpx")
 
 
+def non_negative_float(value):
+    f = float(value)
+    # written this way round so that nan is rejected too
+    if not f >= 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return f
+
+
 def parse_args():
     p = argparse.ArgumentParser(description="Sync Viofo dashcam recordings")
     p.add_argument("address", help="Dashcam IP/hostname")
@@ -489,6 +1052,15 @@ def parse_args():
     p.add_argument("-k", "--keep", help="Keep for <number>[d|w]")
     p.add_argument("-u", "--max-used-disk", type=int, choices=range(5, 99), default=90, metavar="DISK%")
     p.add_argument("-t", "--timeout", type=float, default=10.0, help="Timeout seconds")
+    p.add_argument("-c", "--concurrency", type=int, choices=range(1, 33), default=4, metavar="N",
+                   help="Number of recordings to download in parallel")
+    p.add_argument("-s", "--segments", type=int, choices=range(1, 9), default=4, metavar="K",
+                   help="Connections used to download each recording over 64 MiB, if the dashcam supports range "
+                        "requests; at most N*K connections are open at once")
+    p.add_argument("--max-attempts", type=int, choices=range(1, 11), default=3, metavar="N",
+                   help="Download attempts per recording")
+    p.add_argument("--backoff-base", type=non_negative_float, default=5.0, metavar="SECONDS",
+                   help="Delay before the first retry, doubled for every further attempt")
     p.add_argument("-v", "--verbose", action="count", default=0)
     p.add_argument("-q", "--quiet", action="store_true")
     p.add_argument("--dry-run", action="store_true")
@@ -501,9 +1073,18 @@ def parse_args():
 
 def monitor_loop(address, destination, grouping, priority, recording_filter, args):
     sleep_time_s = 600
+    max_sleep_time_s = 4 * sleep_time_s
     base_url = f"http://{address}"
     list_url = f"{base_url}/?custom=1&cmd=3015&par=1"
 
+    # a recording's size only changes while the camera is still writing it, and then so does its listing entry
+    remote_cache = {}
+    # validators of the last file list, so that the camera can tell us it hasn't changed
+    listing_known = {}
+    listed_recs = None
+    # consecutive cycles in which nothing changed; the camera is polled less often the longer it stays that way
+    idle_cycles = 0
+
     logger.info("Entering monitor loop (Ctrl+C to exit)")
     while True:
         # 1) Connectivity check
@@ -514,70 +1095,123 @@ def monitor_loop(address, destination, grouping, priority, recording_filter, arg
 
         # 2) Fetch & filter list
         try:
-            recs = get_dashcam_filenames(base_url)
+            recs = get_dashcam_filenames(
+                base_url, listing_known, {r.filepath: r for r in listed_recs} if listed_recs else None
+            )
         except Exception as e:
             logger.warning(f"Failed to fetch file list: {e}; retrying in {sleep_time_s}s")
             time.sleep(sleep_time_s)
             continue
+        if recs is None:
+            # 304 Not Modified; the local files are still checked against it below
+            recs = listed_recs
+        listed_recs = recs
 
         recs.sort(key=lambda r: r.datetime, reverse=(priority=="rdate"))
         if recording_filter:
             recs = [r for r in recs if any(f in r.filename for f in recording_filter)]
             logger.info(f"After filter: {len(recs)} recordings")
 
-        # 3) Figure out which need (re)download
-        to_dl = []
+        # 3) Figure out which need (re)download; files we have state for get a conditional HEAD
+        listed = {r.filepath for r in recs}
+        state = {fp: entry for fp, entry in load_state(destination).items() if fp in listed}
+        remote_cache = {key: remote for key, remote in remote_cache.items() if key[0] in listed}
+        local_files = scan_local_files(destination, grouping)
+        group_name_of = group_name_formatters[grouping]
+        candidates = []
         for rec in recs:
             if cutoff_date and rec.datetime.date() < cutoff_date:
                 continue
+            local_fp = get_filepath(destination, group_name_of(rec.datetime.date()), rec.filename)
+            candidates.append((rec, local_fp, local_files.get(local_fp)))
+
+        # the HEADs are independent round-trips, so like the downloads they run side by side; results are only
+        # gathered here, in this thread, so nothing shared needs a lock
+        probed = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {}
+            for rec, local_fp, local_st in candidates:
+                cache_key = (rec.filepath, rec.timecode, rec.size)
+                if cache_key in remote_cache:
+                    continue
+                cleaned = rec.filepath.replace('A:', '').replace('\\','/')
+                entry = state.get(rec.filepath)
+                if entry and not is_state_current(entry, local_st):
+                    entry = None
+                future = pool.submit(get_remote_info, f"{base_url}/{cleaned}", socket_timeout, entry)
+                futures[future] = (cache_key, entry)
+            for future in as_completed(futures):
+                cache_key, entry = futures[future]
+                try:
+                    remote = future.result()
+                except Exception:
+                    continue
+                if remote is None:
+                    # 304 Not Modified: the camera still has what the state entry describes, so keep that until the
+                    # listing entry changes rather than asking again every cycle
+                    remote = RemoteInfo(entry["size"], False, entry["etag"], entry["last_modified"])
+                probed[cache_key] = remote
 
-            cleaned = rec.filepath.replace('A:', '').replace('\\','/')
-            url = f"{base_url}/{cleaned}"
-            try:
-                remote_size = get_remote_size(url, socket_timeout)
-            except Exception:
-                continue
-
-            grp = get_group_name(rec.datetime, grouping) or ""
-            local_fp = os.path.join(destination, grp, rec.filename)
-            local_size = os.path.getsize(local_fp) if os.path.exists(local_fp) else -1
-
-            if local_size != remote_size:
+        to_dl = []
+        remotes = {}
+        for rec, local_fp, local_st in candidates:
+            cache_key = (rec.filepath, rec.timecode, rec.size)
+            remote = remote_cache.get(cache_key)
+            if remote is None:
+                # missing if the HEAD failed
+                remote = probed.get(cache_key)
+                if remote is None:
+                    continue
+                remote_cache[cache_key] = remote
+
+            local_size = local_st.st_size if local_st else -1
+            if local_size != remote.size:
                 to_dl.append(rec)
+                remotes[rec.filepath] = (remote, local_fp)
+            else:
+                state[rec.filepath] = get_state_entry(remote, local_st)
 
         # 4) Download changed files, but bail if offline
         if to_dl:
-            total = len(to_dl)
-            logger.info(f"{total} files to (re)download")
-            for i, rec in enumerate(to_dl, start=1):
-                # check *again* before each file
-                if not is_camera_online(list_url, socket_timeout):
-                    logger.info(f"Lost camera mid‐batch; aborting downloads and retrying in {sleep_time_s}s")
-                    break
+            logger.info(f"{len(to_dl)} files to (re)download")
+            if download_recordings(base_url, to_dl, destination, grouping, args, list_url):
+                logger.info(f"All current files downloaded, sleeping for {sleep_time_s}s")
+            else:
+                logger.info(f"Lost camera mid‐batch; aborting downloads and retrying in {sleep_time_s}s")
 
-                logger.info(f"[{i}/{total}] Downloading {rec.filename}")
-                downloaded, _ = download_file(
-                    base_url, rec, destination, grp,
-                    args.timeout, args.dry_run
-                )
-                if downloaded and args.gps_extract:
-                    fp = os.path.join(destination, grp or "", rec.filename)
-                    extract_gps_data(fp)
-                if i == total:
-                    logger.info(f"All current files downloaded, sleeping for {sleep_time_s}s")
+            for filepath, (remote, local_fp) in remotes.items():
+                try:
+                    local_st = os.stat(local_fp)
+                except OSError:
+                    continue
+                if local_st.st_size == remote.size:
+                    state[filepath] = get_state_entry(remote, local_st)
 
         else:
             logger.debug("All files up to date")
 
+        save_state(destination, state)
+
+        # the camera won't hold idle connections open until the next cycle
+        close_connections()
 
-        time.sleep(sleep_time_s)
+        # nothing new or changed on the camera (no HEADs were needed), so wait longer each time until something is
+        idle_cycles = 0 if futures or to_dl else idle_cycles + 1
+        delay = min(sleep_time_s * 2 ** idle_cycles, max_sleep_time_s)
+        if idle_cycles:
+            logger.debug(f"No changes for {idle_cycles} cycle(s), sleeping for {delay}s")
+        time.sleep(delay)
 
 
 
 def run():
-    global dry_run, cutoff_date, socket_timeout
+    global dry_run, cutoff_date, socket_timeout, concurrency, segments, max_download_attempts, retry_backoff
     args = parse_args()
     socket_timeout = args.timeout
+    concurrency = args.concurrency
+    segments = args.segments
+    max_download_attempts = args.max_attempts
+    retry_backoff = args.backoff_base
     socket.setdefaulttimeout(socket_timeout)
 
     if args.quiet:
@@ -598,14 +1232,17 @@ def run():
         cutoff_date = datetime.date.today() - delta
         logger.info(f"Cutoff date: {cutoff_date}")
 
-    if args.monitor:
-        monitor_loop(args.address, args.destination, args.grouping,
-                     args.priority, args.filter, args)
-        return 0
-
-    success = sync(args.address, args.destination,
-                   args.grouping, args.priority, args.filter, args)
-    return 0 if success else 1
+    try:
+        if args.monitor:
+            monitor_loop(args.address, args.destination, args.grouping,
+                         args.priority, args.filter, args)
+            return 0
+
+        success = sync(args.address, args.destination,
+                       args.grouping, args.priority, args.filter, args)
+        return 0 if success else 1
+    finally:
+        close_connections()
 
 
 if __name__ == "__main__":
@@ -19,6 +19,9 @@ flags=()
 # timeout
 [ -n "${TIMEOUT:-}" ] && flags+=( --timeout "$TIMEOUT" )
 
+# concurrency
+[ -n "${CONCURRENCY:-}" ] && flags+=( --concurrency "$CONCURRENCY" )
+
 # verbosity
 if [ "${VERBOSE:-0}" -gt 0 ]; then
   for i in $(seq 1 "$VERBOSE"); do